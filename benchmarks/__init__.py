@@ -0,0 +1,3 @@
+"""
+Benchmarks for the graph utility functions, see benchmarks/run.py.
+"""
@@ -0,0 +1,145 @@
+"""
+Reproducible synthetic ledgers for the benchmarks.
+The same seed always gives the same ledger.
+"""
+
+import numpy as np
+import pandas as pd
+
+from typing import List
+
+
+# equal_split: somebody pays for a group and the amount is split equally
+# skewed: like equal_split, but a few people pay for almost everything
+# cancelling: most people owe exactly what somebody else is owed
+# small_amounts: many small whole euro expenses, so the balances are small and close together
+DISTRIBUTIONS: List[str] = ["equal_split", "skewed", "cancelling", "small_amounts"]
+
+
+def _names(people: int) -> np.ndarray:
+    return np.array([f"P{i}" for i in range(people)], dtype=object)
+
+
+def _split_expenses(
+    rng: np.random.Generator, people: int, expenses: int, payer_weights: np.ndarray
+) -> pd.DataFrame:
+    """
+    Every expense is paid by one person and split equally between 2 to 6 people,
+    one row per person that has to pay back their share.
+    """
+    group_sizes = rng.integers(2, 7, size=expenses)
+    payers = rng.choice(people, size=expenses, p=payer_weights)
+    shares = rng.integers(100, 10_000, size=expenses)
+
+    givers = np.repeat(payers, group_sizes)
+    receivers = rng.integers(0, people, size=len(givers))
+    # Nobody pays back themselves, the next person does instead
+    receivers = np.where(receivers == givers, (receivers + 1) % people, receivers)
+
+    return pd.DataFrame(
+        {
+            "Giver": givers,
+            "Receiver": receivers,
+            "Amount": np.repeat(shares, group_sizes),
+        }
+    )
+
+
+def _cancelling_expenses(
+    rng: np.random.Generator, people: int, expenses: int
+) -> pd.DataFrame:
+    """
+    People are paired up and every pair only has expenses between the two of them,
+    so the net balances cancel each other out in exact pairs.
+    The expenses of a fifth of the pairs go to random people of those pairs,
+    so the matching algorithms still have to work.
+    """
+    order = rng.permutation(people)
+    pairs = order[: people // 2 * 2].reshape(-1, 2)
+
+    pair_of_expense = rng.integers(0, len(pairs), size=expenses)
+    chosen = pairs[pair_of_expense]
+    flip = rng.random(expenses) < 0.5
+    givers = np.where(flip, chosen[:, 0], chosen[:, 1])
+    partners = np.where(flip, chosen[:, 1], chosen[:, 0])
+    receivers = partners
+
+    is_noisy = rng.random(len(pairs)) < 0.2
+    noisy_people = pairs[is_noisy].ravel()
+    if len(noisy_people) > 0:
+        # Only people of the noisy pairs, so the other pairs still cancel out
+        receivers = np.where(
+            is_noisy[pair_of_expense],
+            noisy_people[rng.integers(0, len(noisy_people), size=expenses)],
+            receivers,
+        )
+        receivers = np.where(receivers == givers, partners, receivers)
+
+    return pd.DataFrame(
+        {
+            "Giver": givers,
+            "Receiver": receivers,
+            "Amount": rng.integers(100, 10_000, size=expenses),
+        }
+    )
+
+
+def _small_expenses(
+    rng: np.random.Generator, people: int, expenses: int
+) -> pd.DataFrame:
+    """
+    Expenses of 1 to 10 euros between random people. Many balances can be combined into groups
+    that add up to 0, which is the hard case for pair_zero_sum_groups_first.
+    """
+    givers = rng.integers(0, people, size=expenses)
+    receivers = (givers + rng.integers(1, people, size=expenses)) % people
+
+    return pd.DataFrame(
+        {
+            "Giver": givers,
+            "Receiver": receivers,
+            "Amount": rng.integers(1, 11, size=expenses) * 100,
+        }
+    )
+
+
+def generate_ledger(
+    people: int, expenses: int, distribution: str = "equal_split", seed: int = 0
+) -> pd.DataFrame:
+    """
+    Returns a Giver/Receiver/Amount DataFrame with the amounts in cents.
+    """
+    if people < 2:
+        raise ValueError("A ledger needs at least 2 people")
+
+    rng = np.random.default_rng(seed)
+
+    if distribution == "equal_split":
+        df = _split_expenses(rng, people, expenses, np.full(people, 1 / people))
+    elif distribution == "skewed":
+        # Zipf like: the i-th person pays 1/(i+1) as often as the first one
+        weights = 1 / np.arange(1, people + 1)
+        df = _split_expenses(rng, people, expenses, weights / weights.sum())
+    elif distribution == "cancelling":
+        df = _cancelling_expenses(rng, people, expenses)
+    elif distribution == "small_amounts":
+        df = _small_expenses(rng, people, expenses)
+    else:
+        raise ValueError(
+            f"Unknown distribution {distribution}, choose from {DISTRIBUTIONS}"
+        )
+
+    names = _names(people)
+    df["Giver"] = names[df["Giver"].to_numpy()]
+    df["Receiver"] = names[df["Receiver"].to_numpy()]
+
+    return df
+
+
+def save_ledger_csv(df: pd.DataFrame, path: str) -> None:
+    """
+    Saves a ledger like the files in data/, with the amounts in euros.
+    """
+    out = df.copy()
+    out["Amount"] = (out["Amount"] / 100).map("{:.2f}".format)
+    out.to_csv(path, index=False)
@@ -0,0 +1,397 @@
+"""
+Times the graph utility functions on synthetic ledgers of different sizes and saves
+the results as JSON, so two versions can be compared, e.g.
+
+    python -m benchmarks.run --output before.json
+    python -m benchmarks.run --output after.json --baseline before.json
+
+Every function is timed repeat times and the fastest run counts.
+The peak memory is measured in one extra run under tracemalloc, since tracing slows the code down.
+
+The cold start of short lived jobs is timed as well: a fresh interpreter that only imports
+the modules or settles a small file, together with whether pandas was imported on the way.
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from typing import Any, Callable, Dict, List, Optional
+
+from src import graph_utils
+from .generator import DISTRIBUTIONS, generate_ledger, save_ledger_csv
+
+
+def _measure(
+    func: Callable[[], Any], repeat: int, settles: bool
+) -> Dict[str, Any]:
+    seconds = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        seconds.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    try:
+        func()
+        _, peak_memory = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    if not settles:
+        # Only the settled graphs have transactions, the others just have the expenses as edges
+        transactions = None
+    elif "edges" in result:
+        transactions = len(result["edges"])
+    else:
+        # The settled graph of every group of a batch
+        transactions = sum(len(g["edges"]) for g in result.values())
+
+    return {
+        "seconds": min(seconds),
+        "peak_memory": peak_memory,
+        "transactions": transactions,
+    }
+
+
+def _cases(
+    df: pd.DataFrame, csv_path: str, time_budget: Optional[float]
+) -> Dict[str, Callable[[], Any]]:
+    """
+    Everything that is timed for one ledger. The pair_* strategies get the already netted graph,
+    just like they do in process_CSV. time_budget limits the exponential searches.
+    """
+    graph = graph_utils.df_to_graph(df)
+    reduced = graph_utils.reduce_net_balance(graph)
+
+    def deadline() -> Optional[float]:
+        return None if time_budget is None else time.monotonic() + time_budget
+
+    return {
+        "reduce_net_balance": lambda: graph_utils.reduce_net_balance(graph),
+        "df_to_graph": lambda: graph_utils.df_to_graph(df),
+        "pair_largest_difference_first": lambda: graph_utils.pair_largest_difference_first(
+            reduced
+        ),
+        "pair_matching_differences_first": lambda: graph_utils.pair_matching_differences_first(
+            reduced, deadline=deadline()
+        ),
+        "pair_matching_differences_first_closest": lambda: graph_utils.pair_matching_differences_first(
+            reduced, use_closest_matching=True, deadline=deadline()
+        ),
+        "pair_closest_differences_first": lambda: graph_utils.pair_closest_differences_first(
+            reduced
+        ),
+        "pair_zero_sum_groups_first": lambda: graph_utils.pair_zero_sum_groups_first(
+            reduced, deadline=deadline()
+        ),
+        "process_CSV": lambda: graph_utils.process_CSV(
+            csv_path, time_budget=time_budget
+        ),
+        "process_CSV_auto": lambda: graph_utils.process_CSV(
+            csv_path, time_budget=time_budget, strategies=[graph_utils.AUTO_STRATEGY]
+        ),
+    }
+
+
+# People per group of the batch ledgers, like a trip or a household
+_BATCH_GROUP_SIZE = 5
+
+
+def _save_batch(
+    tmp_dir: str,
+    people: int,
+    expenses_per_person: int,
+    distribution: str,
+    seed: int,
+) -> Dict[str, Any]:
+    """
+    Splits the people into groups of _BATCH_GROUP_SIZE with a ledger each.
+    Saves every group on its own and all of them as one file with a Group column.
+    """
+    groups = max(1, people // _BATCH_GROUP_SIZE)
+    dfs = [
+        generate_ledger(
+            _BATCH_GROUP_SIZE,
+            _BATCH_GROUP_SIZE * expenses_per_person,
+            distribution,
+            seed=seed + i,
+        )
+        for i in range(groups)
+    ]
+
+    group_paths = {}
+    for i, df in enumerate(dfs):
+        group_paths[f"G{i}"] = os.path.join(
+            tmp_dir, f"{distribution}_{people}_group_{i}.csv"
+        )
+        save_ledger_csv(df, group_paths[f"G{i}"])
+
+    batch_path = os.path.join(tmp_dir, f"{distribution}_{people}_batch.csv")
+    save_ledger_csv(
+        pd.concat(
+            [df.assign(Group=group) for group, df in zip(group_paths, dfs)],
+            ignore_index=True,
+        ),
+        batch_path,
+    )
+
+    return {
+        "group_paths": group_paths,
+        "batch_path": batch_path,
+        "rows": sum(len(df) for df in dfs),
+    }
+
+
+def _batch_cases(
+    group_paths: Dict[str, str], batch_path: str, time_budget: Optional[float]
+) -> Dict[str, Callable[[], Any]]:
+    """
+    The same groups settled in one batch and with one process_CSV call each.
+    """
+    return {
+        "process_batch_CSV": lambda: graph_utils.process_batch_CSV(
+            batch_path, time_budget=time_budget
+        ),
+        "process_CSV_per_group": lambda: {
+            group: graph_utils.process_CSV(path, time_budget=time_budget)
+            for group, path in group_paths.items()
+        },
+    }
+
+
+def run_benchmarks(
+    sizes: List[int],
+    distributions: List[str],
+    expenses_per_person: int = 20,
+    seed: int = 0,
+    repeat: int = 3,
+    time_budget: Optional[float] = 1.0,
+    only: Optional[List[str]] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Returns one result per size, distribution and function.
+    """
+    results: List[Dict[str, Any]] = []
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for distribution in distributions:
+            for people in sizes:
+                df = generate_ledger(
+                    people, people * expenses_per_person, distribution, seed=seed
+                )
+                csv_path = os.path.join(tmp_dir, f"{distribution}_{people}.csv")
+                save_ledger_csv(df, csv_path)
+
+                batch = _save_batch(
+                    tmp_dir, people, expenses_per_person, distribution, seed
+                )
+
+                cases = [
+                    (name, func, len(df))
+                    for name, func in _cases(df, csv_path, time_budget).items()
+                ] + [
+                    (name, func, batch["rows"])
+                    for name, func in _batch_cases(
+                        batch["group_paths"], batch["batch_path"], time_budget
+                    ).items()
+                ]
+
+                for name, func, rows in cases:
+                    if only is not None and name not in only:
+                        continue
+
+                    results.append(
+                        {
+                            "function": name,
+                            "distribution": distribution,
+                            "people": people,
+                            "rows": rows,
+                            **_measure(
+                                func,
+                                repeat,
+                                settles=name.startswith(
+                                    ("pair_", "process_CSV", "process_batch_CSV")
+                                ),
+                            ),
+                        }
+                    )
+
+    return results
+
+
+# Run in a fresh interpreter each, {path} is a small ledger
+_COLD_START_SCRIPTS = {
+    "python": "pass",
+    "import_graph_utils": "from src import graph_utils",
+    "import_main": "from src import main",
+    "process_CSV_small": "from src import graph_utils; graph_utils.process_CSV({path!r})",
+}
+
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def run_cold_start(repeat: int = 5, people: int = 10, seed: int = 0) -> List[Dict[str, Any]]:
+    """
+    Times every script of _COLD_START_SCRIPTS from starting the interpreter until it exits,
+    the fastest of repeat runs counts. "python" alone is the time of the interpreter itself.
+    """
+    results: List[Dict[str, Any]] = []
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        csv_path = os.path.join(tmp_dir, "small.csv")
+        save_ledger_csv(generate_ledger(people, people * 5, "equal_split", seed=seed), csv_path)
+
+        for name, script in _COLD_START_SCRIPTS.items():
+            command = [
+                sys.executable,
+                "-c",
+                script.format(path=csv_path) + "\nimport sys; print('pandas' in sys.modules)",
+            ]
+
+            seconds = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                output = subprocess.run(
+                    command, cwd=_ROOT, capture_output=True, text=True, check=True
+                ).stdout
+                seconds.append(time.perf_counter() - start)
+
+            results.append(
+                {
+                    "function": name,
+                    "seconds": min(seconds),
+                    "pandas_loaded": output.split()[-1] == "True",
+                }
+            )
+
+    return results
+
+
+def _key(result: Dict[str, Any]) -> tuple:
+    return (result["function"], result["distribution"], result["people"])
+
+
+def _print_results(
+    results: List[Dict[str, Any]], baseline: Optional[List[Dict[str, Any]]]
+) -> None:
+    before = {_key(r): r for r in baseline or []}
+
+    for r in results:
+        line = (
+            f"{r['function']:<42} {r['distribution']:<12} {r['people']:>6} people "
+            f"{r['seconds'] * 1000:>10.2f} ms {r['peak_memory'] / 2**20:>8.2f} MiB"
+        )
+        if r["transactions"] is not None:
+            line += f" {r['transactions']:>6} transactions"
+        if _key(r) in before and before[_key(r)]["seconds"] > 0:
+            line += f"  x{r['seconds'] / before[_key(r)]['seconds']:.2f} of baseline"
+        print(line)
+
+
+def _print_cold_start(
+    results: List[Dict[str, Any]], baseline: Optional[List[Dict[str, Any]]]
+) -> None:
+    before = {r["function"]: r for r in baseline or []}
+
+    for r in results:
+        line = f"cold start {r['function']:<31} {r['seconds'] * 1000:>10.2f} ms"
+        if r["pandas_loaded"]:
+            line += " (imports pandas)"
+        if r["function"] in before and before[r["function"]]["seconds"] > 0:
+            line += f"  x{r['seconds'] / before[r['function']]['seconds']:.2f} of baseline"
+        print(line)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.run")
+    parser.add_argument(
+        "--sizes",
+        type=int,
+        nargs="+",
+        default=[10, 100, 1000],
+        help="Number of people per ledger",
+    )
+    parser.add_argument(
+        "--distributions", nargs="+", choices=DISTRIBUTIONS, default=DISTRIBUTIONS
+    )
+    parser.add_argument("--expenses-per-person", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument(
+        "--time-budget",
+        type=float,
+        default=1.0,
+        help="Seconds the exponential searches may take per run",
+    )
+    parser.add_argument("--only", nargs="+", help="Only run these functions")
+    parser.add_argument(
+        "--cold-start-repeat",
+        type=int,
+        default=5,
+        help="Fresh interpreters started per cold start measurement, 0 skips them",
+    )
+    parser.add_argument("--output", help="Save the results as JSON")
+    parser.add_argument("--baseline", help="JSON results of an earlier run to compare to")
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(
+        args.sizes,
+        args.distributions,
+        expenses_per_person=args.expenses_per_person,
+        seed=args.seed,
+        repeat=args.repeat,
+        time_budget=args.time_budget,
+        only=args.only,
+    )
+
+    cold_start = (
+        run_cold_start(args.cold_start_repeat, seed=args.seed)
+        if args.cold_start_repeat > 0
+        else []
+    )
+
+    baseline = None
+    baseline_cold_start = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            saved = json.load(f)
+        baseline = saved["results"]
+        # Older results were saved without the cold start
+        baseline_cold_start = saved.get("cold_start")
+
+    _print_results(results, baseline)
+    _print_cold_start(cold_start, baseline_cold_start)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(
+                {
+                    "python": sys.version,
+                    "platform": platform.platform(),
+                    "numpy": np.__version__,
+                    "pandas": pd.__version__,
+                    "seed": args.seed,
+                    "expenses_per_person": args.expenses_per_person,
+                    "time_budget": args.time_budget,
+                    "results": results,
+                    "cold_start": cold_start,
+                },
+                f,
+                indent=2,
+            )
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
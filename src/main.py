@@ -1,12 +1,244 @@
 """
-This is the only place to edit to actually use the program
-It is only necessary to provide a valid path to a csv. and then run main.py
+Command line interface to settle one or many CSV files at once, e.g.
+
+    python -m src.main data/*.csv --output-dir settled/ --workers 4
+
+Every file is settled on its own. With more than one worker and more than one file,
+the files are processed at the same time in a pool of processes.
 """
 
-from .graph_utils import process_CSV, print_graph
+import argparse
+import glob
+import multiprocessing
+import os
+import sys
+import time
+
+from typing import Any, Dict, List, Optional, Tuple
+
+from .graph_utils import (
+    AUTO_STRATEGY,
+    MATCHING_STRATEGIES,
+    OUTPUT_FORMATS,
+    VERIFY_LEVELS,
+    SettlementCache,
+    SettlementStats,
+    process_CSV,
+    print_graph,
+)
+
+# (path, transactions, is_complete, seconds, error, stats)
+Result = Tuple[
+    str, Optional[int], Optional[bool], float, Optional[str], Optional[Dict[str, Any]]
+]
+
+
+def _expand_paths(patterns: List[str]) -> List[str]:
+    """
+    Expands globs that the shell did not expand already (e.g. on Windows or when quoted).
+    Duplicates are removed, the order stays the same.
+    """
+    paths: List[str] = []
+    for pattern in patterns:
+        if glob.has_magic(pattern):
+            paths += sorted(glob.glob(pattern, recursive=True))
+        else:
+            paths.append(pattern)
+
+    return list(dict.fromkeys(paths))
+
+
+_EXTENSIONS = {"csv": "csv", "ndjson": "ndjson", "binary": "bin"}
+
+
+def _output_path(
+    path_to_csv: str, output_dir: Optional[str], output_format: str
+) -> Optional[str]:
+    if output_dir is None:
+        return None
+
+    name, _ = os.path.splitext(os.path.basename(path_to_csv))
+    return os.path.join(output_dir, f"{name}_settled.{_EXTENSIONS[output_format]}")
+
+
+def _process_file(
+    path_to_csv: str, args: argparse.Namespace, workers: Optional[int]
+) -> Result:
+    """
+    Settles a single file and returns (path, transactions, is_complete, seconds, error, stats).
+    Errors are returned instead of raised, so one broken file does not stop the others.
+    """
+    start = time.perf_counter()
+    stats = SettlementStats() if args.stats else None
+
+    try:
+        graph = process_CSV(
+            path_to_csv,
+            save_csv_path=_output_path(path_to_csv, args.output_dir, args.format),
+            time_budget=args.time_budget,
+            workers=workers,
+            chunksize=args.chunksize,
+            strategies=args.strategy,
+            cache=None
+            if args.cache_dir is None
+            else SettlementCache(directory=args.cache_dir),
+            stats=stats,
+            verify=args.verify,
+            output_format=args.format,
+        )
+    except Exception as e:
+        return path_to_csv, None, None, time.perf_counter() - start, repr(e), None
+
+    assert graph is not None
+    if args.print:
+        print_graph(graph)
+
+    return (
+        path_to_csv,
+        len(graph["edges"]),
+        graph.get("is_complete", True),
+        time.perf_counter() - start,
+        None,
+        None if stats is None else stats.as_dict(),
+    )
+
+
+def _process_file_in_pool(path_to_csv: str, args: argparse.Namespace) -> Result:
+    # Pool workers can not start pools of their own, so every file runs sequentially
+    return _process_file(path_to_csv, args, workers=None)
+
+
+def _parse_args(argv: Optional[List[str]]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        prog="python -m src.main",
+        description="Minimizes the number of transactions needed to settle the debts in CSV files "
+        "with the columns Giver, Receiver and Amount.",
+    )
+    parser.add_argument(
+        "paths",
+        nargs="+",
+        help="CSV files, columnar files (.npz, .npy directories, .parquet, .arrow) or glob patterns",
+    )
+    parser.add_argument(
+        "-o",
+        "--output-dir",
+        help="Directory to save the transactions of every file into, as <name>_settled.csv",
+    )
+    parser.add_argument(
+        "-f",
+        "--format",
+        choices=OUTPUT_FORMATS,
+        default="csv",
+        help="Format of the saved transactions (default: csv)",
+    )
+    parser.add_argument(
+        "-s",
+        "--strategy",
+        action="append",
+        choices=MATCHING_STRATEGIES + [AUTO_STRATEGY],
+        help="Matching algorithm to run, can be given more than once (default: all). "
+        f"{AUTO_STRATEGY} picks them for every group from its balances",
+    )
+    parser.add_argument(
+        "-w",
+        "--workers",
+        type=int,
+        default=None,
+        help="Number of processes (default: sequential)",
+    )
+    parser.add_argument(
+        "-t",
+        "--time-budget",
+        type=float,
+        default=None,
+        help="Seconds every file may spend on the search (default: no limit)",
+    )
+    parser.add_argument(
+        "--chunksize",
+        type=int,
+        default=None,
+        help="Stream every file this many rows at a time",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        help="Directory to cache settlements in, files with already settled balances are not settled again",
+    )
+    parser.add_argument(
+        "--verify",
+        choices=VERIFY_LEVELS,
+        default="full",
+        help="How thoroughly every result is checked (default: full)",
+    )
+    parser.add_argument(
+        "--stats",
+        action="store_true",
+        help="Report the time of every stage and how often the expensive steps ran",
+    )
+    parser.add_argument(
+        "--print", action="store_true", help="Print the transactions of every file"
+    )
+
+    args = parser.parse_args(argv)
+
+    # auto picks the algorithms itself, it can not be mixed with given ones
+    if args.strategy is not None and AUTO_STRATEGY in args.strategy:
+        if set(args.strategy) != {AUTO_STRATEGY}:
+            parser.error(f"--strategy {AUTO_STRATEGY} can not be combined with others")
+        args.strategy = [AUTO_STRATEGY]
+
+    return args
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """
+    Returns the exit code: 0 if every file was settled, 1 otherwise.
+    """
+    args = _parse_args(argv)
+    paths = _expand_paths(args.paths)
+
+    if not paths:
+        print("No files found...", file=sys.stderr)
+        return 1
+
+    if args.output_dir is not None:
+        os.makedirs(args.output_dir, exist_ok=True)
+
+    start = time.perf_counter()
+
+    if args.workers is not None and args.workers > 1 and len(paths) > 1:
+        with multiprocessing.Pool(processes=min(args.workers, len(paths))) as pool:
+            results = pool.starmap(
+                _process_file_in_pool, [(path, args) for path in paths]
+            )
+    else:
+        # A single file can use the workers to race the algorithms instead
+        results = [_process_file(path, args, args.workers) for path in paths]
+
+    failed = 0
+    for path, transactions, is_complete, seconds, error, stats in results:
+        if error is not None:
+            failed += 1
+            print(f"{path}: failed after {seconds:.3f} s: {error}", file=sys.stderr)
+            continue
+
+        note = "" if is_complete else " (time budget exceeded, maybe not optimal)"
+        print(f"{path}: {transactions} transactions in {seconds:.3f} s{note}")
+
+        if stats is not None:
+            for stage, s in stats["stages"].items():
+                print(
+                    f"    {stage:<32} {s['seconds'] * 1000:>10.2f} ms {s['calls']:>6} calls"
+                )
+            for counter, n in stats["counters"].items():
+                print(f"    {counter:<32} {n:>10}")
+
+    print(
+        f"{len(paths) - failed} of {len(paths)} files settled "
+        f"in {time.perf_counter() - start:.3f} s"
+    )
+
+    return 1 if failed else 0
+
 
-graph = process_CSV("<your PATH>", "<your save PATH>")
-if graph:
-    print_graph(graph)
-else:
-    print("No Graph found...")
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,53 @@
+"""
+Test Cases for the synthetic ledgers and the benchmark runner.
+"""
+
+import json
+
+import pytest
+
+from src import graph_utils
+from benchmarks import run
+from benchmarks.generator import DISTRIBUTIONS, generate_ledger, save_ledger_csv
+
+
+class TestBenchmarks:
+    @pytest.mark.parametrize("distribution", DISTRIBUTIONS)
+    def test_generate_ledger(self, tmp_path, distribution):
+        df = generate_ledger(20, 50, distribution, seed=1)
+
+        assert df.equals(generate_ledger(20, 50, distribution, seed=1))
+        assert not df.equals(generate_ledger(20, 50, distribution, seed=2))
+        assert (df["Giver"] != df["Receiver"]).all()
+
+        path = tmp_path / "ledger.csv"
+        save_ledger_csv(df, str(path))
+        assert graph_utils.net_balance_from_csv(str(path)) == graph_utils.net_balance_from_df(df)
+
+    def test_cancelling_pairs(self):
+        balances = graph_utils.net_balance_from_df(
+            generate_ledger(100, 1000, "cancelling", seed=0)
+        )
+        values = [b for b in balances.values() if b != 0]
+
+        # Most balances have an exact opposite
+        assert sum(1 for b in values if -b in values) > len(values) // 2
+
+    def test_run(self, tmp_path):
+        output = tmp_path / "results.json"
+        assert run.main(["--sizes", "10", "--repeat", "1", "--output", str(output)]) == 0
+        assert run.main(["--sizes", "10", "--repeat", "1", "--baseline", str(output)]) == 0
+
+        saved = json.loads(output.read_text())
+        results = saved["results"]
+        assert len(results) == 11 * len(DISTRIBUTIONS)
+        assert all(r["seconds"] >= 0 and r["peak_memory"] >= 0 for r in results)
+        assert len(saved["cold_start"]) == len(run._COLD_START_SCRIPTS)
+
+    def test_cold_start(self):
+        results = {r["function"]: r for r in run.run_cold_start(repeat=1)}
+
+        assert results.keys() == run._COLD_START_SCRIPTS.keys()
+        # Short jobs on small files never need pandas
+        assert not any(r["pandas_loaded"] for r in results.values())
+        assert all(r["seconds"] > 0 for r in results.values())
@@ -3,7 +3,18 @@ Test Cases for Graph Ultility Functions.
 They do the bulk of the work when it comes to minimizing debts
 """
 
+import io
+import json
+import multiprocessing
+import os
+import random
+import subprocess
+import sys
+import time
+
+import numpy as np
 import pytest
+import pandas as pd
 
 
 from src import graph_utils
@@ -25,6 +36,335 @@ class TestGraphUtils:
         for i, node in enumerate(list(tmp["nodes"].values())):
             assert node["initial_net_balance"] == expected[i]
 
+    @pytest.mark.parametrize(
+        "graph",
+        [TEST_GRAPHS["4_friends"], TEST_GRAPHS["problematic_matching"]],
+    )
+    def test_compact_graph(self, graph):
+        compact = graph_utils.graph_to_compact(graph)
+        tmp = graph_utils.compact_to_graph(graph_utils.copy_compact(compact))
+
+        assert tmp["nodes"] == graph["nodes"]
+        assert tmp["edges"] == graph["edges"]
+
+        # The copy does not share any node with the original graph
+        for key, node in tmp["nodes"].items():
+            assert node is not graph["nodes"][key]
+        for edge in tmp["edges"]:
+            assert edge["origin"] is tmp["nodes"][edge["origin"]["name"]]
+
+    def test_df_to_graph(self):
+        df = pd.DataFrame(
+            {
+                "Giver": ["H", "H", "A", "E"],
+                "Receiver": ["A", "B", "H", "B"],
+                "Amount": [300, 300, 200, 200],
+            }
+        )
+
+        tmp = graph_utils.df_to_graph(df)
+
+        assert list(tmp["nodes"].keys()) == ["H", "A", "E", "B"]
+        assert [
+            (e["origin"]["name"], e["destination"]["name"], e["weight"])
+            for e in tmp["edges"]
+        ] == [("H", "A", 300), ("H", "B", 300), ("A", "H", 200), ("E", "B", 200)]
+        for e in tmp["edges"]:
+            assert e["origin"] is tmp["nodes"][e["origin"]["name"]]
+
+    @pytest.mark.parametrize(
+        "path_to_csv",
+        ["./data/Test_Case_1.csv"],
+    )
+    def test_net_balance_from_df(self, path_to_csv):
+        df = pd.read_csv(path_to_csv)
+        df["Amount"] = (df["Amount"] * 100).astype(int)
+
+        expected = graph_utils.reduce_net_balance(graph_utils.df_to_graph(df))
+        result = graph_utils.net_balance_from_df(df)
+
+        assert list(result.keys()) == list(expected["nodes"].keys())
+        for key, node in expected["nodes"].items():
+            assert result[key] == node["initial_net_balance"]
+
+    @pytest.mark.parametrize("layout", ["npz", "npz_codes", "npy", "arrow", "parquet"])
+    def test_net_balance_from_columnar(self, tmp_path, layout):
+        (df,) = graph_utils._read_csv_chunks("./data/Test_Case_2.csv")
+        givers = df["Giver"].to_numpy(dtype=str)
+        receivers = df["Receiver"].to_numpy(dtype=str)
+        amounts = df["Amount"].to_numpy(dtype=np.int64)
+
+        if layout == "npz":
+            path = tmp_path / "ledger.npz"
+            np.savez(path, Giver=givers, Receiver=receivers, Amount=amounts)
+        elif layout == "npz_codes":
+            path = tmp_path / "ledger.npz"
+            names, codes = np.unique(
+                np.concatenate([givers, receivers]), return_inverse=True
+            )
+            np.savez(
+                path,
+                Giver=codes[: len(df)],
+                Receiver=codes[len(df) :],
+                Amount=amounts,
+                Names=names,
+            )
+        elif layout == "npy":
+            path = tmp_path / "ledger"
+            path.mkdir()
+            np.save(path / "Giver.npy", givers)
+            np.save(path / "Receiver.npy", receivers)
+            np.save(path / "Amount.npy", amounts)
+        else:
+            pa = pytest.importorskip("pyarrow")
+            table = pa.table({"Giver": givers, "Receiver": receivers, "Amount": amounts})
+            if layout == "parquet":
+                path = tmp_path / "ledger.parquet"
+                pytest.importorskip("pyarrow.parquet").write_table(table, path)
+            else:
+                path = tmp_path / "ledger.arrow"
+                with pa.ipc.new_file(path, table.schema) as writer:
+                    writer.write_table(table)
+
+        balances = graph_utils.net_balance_from_columnar(str(path))
+        assert list(balances.items()) == list(graph_utils.net_balance_from_df(df).items())
+
+        assert [
+            (e["origin"]["name"], e["destination"]["name"], e["weight"])
+            for e in graph_utils.process_CSV(str(path))["edges"]
+        ] == [
+            (e["origin"]["name"], e["destination"]["name"], e["weight"])
+            for e in graph_utils.process_CSV("./data/Test_Case_2.csv")["edges"]
+        ]
+
+    @pytest.mark.parametrize("layout", ["arrow", "parquet"])
+    def test_net_balance_from_arrow_nulls(self, tmp_path, layout):
+        pa = pytest.importorskip("pyarrow")
+
+        def write(table):
+            if layout == "parquet":
+                path = tmp_path / "ledger.parquet"
+                pytest.importorskip("pyarrow.parquet").write_table(table, path)
+            else:
+                path = tmp_path / "ledger.arrow"
+                with pa.ipc.new_file(path, table.schema) as writer:
+                    writer.write_table(table)
+            return str(path)
+
+        path = write(
+            pa.table(
+                {
+                    "Giver": ["A", "B"],
+                    "Receiver": ["B", "C"],
+                    "Amount": pa.array([300, None], type=pa.int64()),
+                }
+            )
+        )
+        assert graph_utils.net_balance_from_columnar(path) == {
+            "A": -300,
+            "B": 300,
+            "C": 0,
+        }
+
+        path = write(
+            pa.table(
+                {
+                    "Giver": ["A", None],
+                    "Receiver": pa.array(["B", "C"]).dictionary_encode(),
+                    "Amount": pa.array([300, 200], type=pa.int64()),
+                }
+            )
+        )
+        with pytest.raises(ValueError):
+            graph_utils.net_balance_from_columnar(path)
+
+    def test_net_balance_from_columnar_float_amounts(self, tmp_path):
+        path = tmp_path / "ledger.npz"
+        np.savez(
+            path, Giver=np.array(["A"]), Receiver=np.array(["B"]), Amount=np.array([1.5])
+        )
+
+        with pytest.raises(ValueError):
+            graph_utils.net_balance_from_columnar(str(path))
+
+    @pytest.mark.parametrize(
+        ("amounts", "decimal", "thousands", "expected"),
+        [
+            (["3", "8.29", "0.1", None], ".", None, [300, 829, 10, 0]),
+            (["5,86", "8,29", "-22,14"], ",", None, [586, 829, -2214]),
+            (["1.234,56", "12,5"], ",", ".", [123456, 1250]),
+            (["1,234.567", "0.004"], ".", ",", [123457, 0]),
+        ],
+        ids=[
+            "CENTS - Decimal Point",
+            "CENTS - Decimal Comma",
+            "CENTS - Thousands Point",
+            "CENTS - Rounding",
+        ],
+    )
+    def test_amounts_to_cents(self, amounts, decimal, thousands, expected):
+        result = graph_utils._amounts_to_cents(pd.Series(amounts), decimal, thousands)
+
+        assert result.tolist() == expected
+        assert [
+            graph_utils._text_to_cents(a, decimal, thousands) for a in amounts
+        ] == expected
+
+    @pytest.mark.parametrize(
+        ("content", "expected"),
+        [
+            ("Giver,Receiver,Amount\nA,B,3\nB,C,2.5\n", (".", None)),
+            ('Giver,Receiver,Amount\nA,B,"5,86"\nB,C,3\n', (",", None)),
+            ('Giver,Receiver,Amount\nA,B,"1.234,50"\n', (",", ".")),
+            ('Giver,Receiver,Amount\nA,B,"1,234.50"\n', (".", ",")),
+            ('Giver,Receiver,Amount\nA,B,"1,234"\n', (".", ",")),
+        ],
+        ids=[
+            "SNIFF - Decimal Point",
+            "SNIFF - Decimal Comma",
+            "SNIFF - German Thousands",
+            "SNIFF - English Thousands",
+            "SNIFF - Only Thousands",
+        ],
+    )
+    def test_sniff_separators(self, tmp_path, content, expected):
+        path = tmp_path / "expenses.csv"
+        path.write_text(content)
+
+        assert graph_utils._sniff_separators(str(path)) == expected
+
+    @pytest.mark.parametrize("chunksize", [None, 1000])
+    def test_separators_after_sample(self, tmp_path, chunksize):
+        # Only whole amounts in the sample, the decimal comma comes later
+        rows = [f"P{i % 50},P{(i + 1) % 50},{i % 97}" for i in range(20000)]
+        path = tmp_path / "expenses.csv"
+        path.write_text(
+            "Giver,Receiver,Amount\n" + "\n".join(rows) + '\nP1,P2,"12,50"\n'
+        )
+
+        result = graph_utils.net_balance_from_csv(str(path), chunksize=chunksize)
+        expected = graph_utils.net_balance_from_csv(
+            str(path), chunksize=chunksize, decimal=","
+        )
+
+        assert result == expected
+
+    @pytest.mark.parametrize(
+        "path_to_csv",
+        ["./data/Test_Case_1.csv", "./data/Test_Case_2.csv"],
+        ids=[
+            "TEST CASE 1",
+            "TEST CASE 2",
+        ],
+    )
+    def test_net_balance_from_csv(self, path_to_csv):
+        expected = graph_utils.net_balance_from_csv(path_to_csv)
+        result = graph_utils.net_balance_from_csv(path_to_csv, chunksize=5)
+
+        assert list(result.items()) == list(expected.items())
+
+    @pytest.mark.parametrize(
+        "content",
+        [
+            "Giver,Receiver,Amount\nA,B,3\nB,C,2.5\n\nC,A,\nD,A,-1.005\n",
+            'Amount,Receiver,Giver\n"1.234,50",A,B\n"0,1",C,A\n" 3 ",B,C\n',
+            "\ufeffGiver,Receiver,Amount\nA,B,3\nB,C,2.5\n",
+            "Giver,Receiver,Amount\n1,2,3.5\n2,NA,1\n",
+        ],
+        ids=[
+            "SMALL CSV - Decimal Point",
+            "SMALL CSV - German Thousands",
+            "SMALL CSV - Byte Order Mark",
+            "SMALL CSV - Numeric Names",
+        ],
+    )
+    def test_net_balance_from_small_csv(self, tmp_path, monkeypatch, content):
+        path = tmp_path / "expenses.csv"
+        path.write_text(content, encoding="utf-8")
+
+        result = graph_utils.net_balance_from_csv(str(path))
+
+        # Every file is too large for the csv module now, so pandas reads it
+        monkeypatch.setattr(graph_utils, "_SMALL_CSV_BYTES", -1)
+        expected = graph_utils.net_balance_from_csv(str(path))
+
+        assert list(result.items()) == list(expected.items())
+        assert all(type(name) is str for name in result)
+
+    @pytest.mark.parametrize(
+        "content",
+        [
+            "Giver,Receiver,Amount\nA,B,3\nC\n",
+            "Giver,Amount\nA,3\n",
+            "Giver,Receiver,Amount\nA,B,3\nA,B,1.2.3\n",
+            "Giver,Receiver,Amount\nA,B,1e2\n",
+        ],
+        ids=[
+            "SMALL CSV - Short Row",
+            "SMALL CSV - Missing Column",
+            "SMALL CSV - Two Decimal Points",
+            "SMALL CSV - Exponent",
+        ],
+    )
+    def test_net_balance_from_small_csv_errors(self, tmp_path, monkeypatch, content):
+        path = tmp_path / "expenses.csv"
+        path.write_text(content)
+
+        with pytest.raises(ValueError) as small:
+            graph_utils.net_balance_from_csv(str(path))
+
+        monkeypatch.setattr(graph_utils, "_SMALL_CSV_BYTES", -1)
+        with pytest.raises(ValueError) as large:
+            graph_utils.net_balance_from_csv(str(path))
+
+        assert str(small.value) == str(large.value)
+
+    @pytest.mark.parametrize("size", [1 << 20, -1], ids=["csv module", "pandas"])
+    def test_thousands_without_decimal(self, monkeypatch, size):
+        monkeypatch.setattr(graph_utils, "_SMALL_CSV_BYTES", size)
+
+        with pytest.raises(ValueError):
+            graph_utils.net_balance_from_csv("./data/Test_Case_1.csv", thousands=",")
+
+    @pytest.mark.parametrize(
+        ("amounts", "expected"),
+        [
+            (["3", " 8.29", "-0.07", "+5", None], [300, 829, -7, 500, 0]),
+            (["99999999999.99", "0.1"], [9999999999999, 10]),
+            (["1.005"], None),
+            (["+"], None),
+        ],
+        ids=[
+            "PLAIN CENTS - Exact",
+            "PLAIN CENTS - Large",
+            "PLAIN CENTS - Rounding Left To Text",
+            "PLAIN CENTS - Only A Sign",
+        ],
+    )
+    def test_plain_amounts_to_cents(self, amounts, expected):
+        amounts = pd.Series(amounts, dtype="string")
+        result = graph_utils._plain_amounts_to_cents(amounts)
+
+        if expected is None:
+            assert result is None
+        else:
+            assert result is not None
+            assert result.tolist() == expected
+            assert result.tolist() == graph_utils._amounts_to_cents(amounts).tolist()
+
+    def test_import_without_pandas(self):
+        # A fresh interpreter, this one has already imported pandas for the tests
+        script = (
+            "import sys; from src import graph_utils; "
+            "graph_utils.process_CSV('./data/Test_Case_2.csv'); "
+            "print('pandas' in sys.modules)"
+        )
+        result = subprocess.run(
+            [sys.executable, "-c", script], capture_output=True, text=True, check=True
+        )
+
+        assert result.stdout.strip() == "False"
+
     @pytest.mark.parametrize(
         ("graph", "expected", "is_expected_to_fail"),
         [
@@ -83,6 +423,33 @@ class TestGraphUtils:
         if not is_expected_to_fail:
             assert found_edges == len(tmp["edges"])
 
+    @pytest.mark.parametrize(
+        ("balances", "expected"),
+        [
+            (
+                {"A": 2, "B": 2, "C": -2, "D": -2},
+                [("A", "D", 2), ("B", "C", 2)],
+            ),
+            (
+                {"A": 3, "B": -1, "C": 3, "D": -4, "E": -1},
+                [("A", "D", 3), ("C", "E", 1), ("C", "D", 1), ("C", "B", 1)],
+            ),
+        ],
+        ids=[
+            "LARGEST - Ties",
+            "LARGEST - Ties with partial settlements",
+        ],
+    )
+    def test_pair_largest_difference_first_ties(self, balances, expected):
+        tmp = graph_utils.pair_largest_difference_first(
+            graph_utils.balances_to_graph(balances)
+        )
+
+        assert [
+            (e["origin"]["name"], e["destination"]["name"], e["weight"])
+            for e in tmp["edges"]
+        ] == expected
+
     @pytest.mark.parametrize(
         ("graph", "expected", "is_expected_to_fail"),
         [
@@ -215,6 +582,151 @@ class TestGraphUtils:
         if not is_expected_to_fail:
             assert found_edges == len(tmp["edges"])
 
+    @pytest.mark.parametrize(
+        ("graph", "expected"),
+        [
+            (TEST_GRAPHS["0_sum"], 0),
+            (TEST_GRAPHS["4_trans_to_3"], 3),
+            (TEST_GRAPHS["counter_example_longest"], 3),
+            (TEST_GRAPHS["counter_example_opposite"], 4),
+            (TEST_GRAPHS["problematic_matching"], 5),
+            (TEST_GRAPHS["closest_matching"], 3),
+        ],
+        ids=[
+            "EXACT - balances equal to 0",
+            "EXACT - simple 4->3",
+            "EXACT - Counter Example",
+            "EXACT - Counter Example Opposite #2",
+            "EXACT - Problematic Matching",
+            "EXACT - Closest Matching",
+        ],
+    )
+    def test_pair_zero_sum_groups_first(self, graph, expected):
+        tmp = graph_utils.pair_zero_sum_groups_first(
+            graph_utils.reduce_net_balance(graph)
+        )
+
+        graph_utils._assert_graph_correctness(tmp)
+        assert len(tmp["edges"]) == expected
+
+    @pytest.mark.parametrize(
+        ("values", "expected"),
+        [
+            ([3, -3], 1),
+            ([5, -2, -3, 4, -4], 2),
+            ([6, 6, -4, -4, -4], 1),
+            ([300, 300, 300, -200, -200, -200, -100, -100, -100], 3),
+            # Many small balances without pairs or triples, at most one group per negative balance
+            (
+                [27, 38, 18, 29, 32, 23, 6, 21, 40, 8, 32, 38, 22]
+                + [13, 16, 2, 18, 8, 15, 24, 11, 22, -135, -88, -93, -147],
+                4,
+            ),
+        ],
+    )
+    def test_max_zero_sum_partition(self, values, expected):
+        partition = graph_utils._max_zero_sum_partition(values)
+
+        assert len(partition) == expected
+        assert sorted(v for group in partition for v in group) == sorted(values)
+        for group in partition:
+            assert sum(group) == 0
+
+    @pytest.mark.parametrize("seed", range(5))
+    def test_max_zero_sum_partition_brute_force(self, seed):
+        def brute_force(values):
+            if not values:
+                return 0
+            # The first balance is part of some group that adds up to 0
+            rest = values[1:]
+            best = 1
+            for mask in range(1, 1 << len(rest)):
+                group = [v for i, v in enumerate(rest) if mask >> i & 1]
+                if values[0] + sum(group) == 0 and len(group) < len(rest):
+                    others = [v for i, v in enumerate(rest) if not mask >> i & 1]
+                    best = max(best, 1 + brute_force(others))
+            return best
+
+        rng = random.Random(seed)
+        for _ in range(20):
+            values = [rng.choice([-1, 1]) * rng.randint(1, 9) for _ in range(9)]
+            values = [v for v in values + [-sum(values)] if v != 0]
+
+            assert len(graph_utils._max_zero_sum_partition(values)) == brute_force(values)
+
+    @pytest.mark.parametrize(
+        ("balances", "expected", "remaining"),
+        [
+            (
+                {"A": 5, "B": -3, "C": -5, "D": 3},
+                [("D", "B", 3), ("A", "C", 5)],
+                [],
+            ),
+            (
+                {"A": 6, "B": -2, "C": -4, "D": 1, "E": -1},
+                [("D", "E", 1), ("A", "B", 2), ("A", "C", 4)],
+                [],
+            ),
+            (
+                {"A": -6, "B": 2, "C": 4, "D": 3, "E": -3},
+                [("D", "E", 3), ("B", "A", 2), ("C", "A", 4)],
+                [],
+            ),
+            (
+                {"A": 7, "B": -2, "C": -4, "D": -1},
+                [],
+                ["A", "B", "C", "D"],
+            ),
+        ],
+        ids=[
+            "EXACT MATCHES - Pairs",
+            "EXACT MATCHES - One Positive, Two Negative",
+            "EXACT MATCHES - Two Positive, One Negative",
+            "EXACT MATCHES - No Matches",
+        ],
+    )
+    def test_settle_exact_matches(self, balances, expected, remaining):
+        tmp = graph_utils.settle_exact_matches(graph_utils.balances_to_graph(balances))
+
+        assert [
+            (e["origin"]["name"], e["destination"]["name"], e["weight"])
+            for e in tmp["edges"]
+        ] == expected
+        assert [
+            n["name"] for n in tmp["nodes"].values() if n["current_net_balance"] != 0
+        ] == remaining
+
+    def test_settle_graph_keeps_zero_sum_exact(self):
+        # Settling the triple 1, 3, -4 first costs a transaction here
+        balances = [-9, -2, 1, -9, -8, 3, -4, -6, 7, 5, 22]
+        graph = graph_utils.balances_to_graph(
+            {chr(ord("A") + i): b for i, b in enumerate(balances)}
+        )
+
+        assert len(graph_utils.pair_zero_sum_groups_first(graph)["edges"]) == 8
+        for strategies in [None, ["zero_sum"], [graph_utils.AUTO_STRATEGY]]:
+            tmp = graph_utils.settle_graph(graph, strategies=strategies)
+            assert len(tmp["edges"]) == 8
+
+    @pytest.mark.parametrize(
+        ("key", "ceiling", "lower"),
+        [
+            (0, 1, None),
+            (5, 5, 4),
+            (6, 8, 5),
+            (13, None, 12),
+        ],
+    )
+    def test_sorted_keys(self, key, ceiling, lower):
+        keys = graph_utils._SortedKeys([8, 1, 12, 5, 3], load=2)
+        keys.add(4)
+        keys.add(10)
+        keys.remove(10)
+
+        assert keys.ceiling(key) == ceiling
+        assert keys.lower(key) == lower
+        assert len(keys) == 6
+
     @pytest.mark.parametrize(
         ("target", "arr", "expected"),
         [
@@ -233,6 +745,46 @@ class TestGraphUtils:
         for i, e in enumerate(expected):
             assert e == result[i]
 
+    @pytest.mark.parametrize(
+        ("target", "arr", "expected"),
+        [
+            (9, [-4, -4, -5, -9, -10], [0, 2]),
+            (7, [-1, -3, -5], []),
+            (1000, [-300, -200, -500, -700, -300], [0, 1, 2]),
+            (10**12, [-(10**11), -(6 * 10**11), -(4 * 10**11)], [1, 2]),
+        ],
+        ids=[
+            "SUBSET - Small",
+            "SUBSET - No Subset",
+            "SUBSET - Cents",
+            "SUBSET - Meet in the Middle",
+        ],
+    )
+    def test_subset_sum_index(self, arr, target, expected):
+        index = graph_utils._SubsetSumIndex(tuple(arr))
+
+        assert index.find(target) == expected
+
+    @pytest.mark.parametrize("seed", [0, 1, 2])
+    def test_subset_sum_index_memory_limit(self, monkeypatch, seed):
+        rng = random.Random(seed)
+        arr = tuple(-rng.randint(0, 60) for _ in range(40))
+        targets = range(sum(abs(a) for a in arr) + 2)
+        expected = [graph_utils._SubsetSumIndex(arr).find(t) for t in targets]
+
+        # Only every 7th row fits into the memory
+        monkeypatch.setattr(
+            graph_utils, "_BITSET_MEMORY_LIMIT", 20 * (sum(abs(a) for a in arr) + 1)
+        )
+        index = graph_utils._SubsetSumIndex(arr)
+        assert index.stride == 7
+        assert [index.find(t) for t in targets] == expected
+
+        # Not even that fits
+        monkeypatch.setattr(graph_utils, "_BITSET_MEMORY_LIMIT", 10)
+        reachable = next(t for t, e in zip(targets, expected) if e)
+        assert graph_utils._SubsetSumIndex(arr).find(reachable) == []
+
     @pytest.mark.parametrize(
         ("path_to_csv", "expected"),
         [
@@ -271,6 +823,534 @@ class TestGraphUtils:
 
         assert found_edges == len(tmp["edges"])
 
+    @pytest.mark.parametrize(
+        "path_to_csv",
+        ["./data/Test_Case_1.csv", "./data/Test_Case_2.csv"],
+        ids=[
+            "TEST CASE 1",
+            "TEST CASE 2",
+        ],
+    )
+    def test_parallel_race(self, path_to_csv):
+        sequential = graph_utils.process_CSV(path_to_csv)
+        parallel = graph_utils.process_CSV(path_to_csv, workers=2)
+
+        graph_utils._assert_graph_correctness(parallel)
+        assert [
+            (e["origin"]["name"], e["destination"]["name"], e["weight"])
+            for e in parallel["edges"]
+        ] == [
+            (e["origin"]["name"], e["destination"]["name"], e["weight"])
+            for e in sequential["edges"]
+        ]
+
+    @pytest.mark.skipif(
+        multiprocessing.get_start_method() != "fork",
+        reason="The workers only see the patched algorithms when they are forked",
+    )
+    def test_parallel_race_stops(self, monkeypatch):
+        graph = graph_utils.balances_to_graph({"A": 300, "B": 500, "C": -200, "D": -600})
+
+        monkeypatch.setitem(
+            graph_utils._MATCHING_ALGORITHMS, "zero_sum", lambda *args: os._exit(1)
+        )
+        with pytest.raises(RuntimeError):
+            graph_utils.find_best_settlement(
+                graph,
+                deadline=time.monotonic() + 2,
+                workers=2,
+                strategies=["zero_sum", "largest"],
+            )
+
+        # The deadline passes while the better algorithm still runs
+        monkeypatch.setitem(
+            graph_utils._MATCHING_ALGORITHMS, "zero_sum", lambda *args: time.sleep(60)
+        )
+        start = time.monotonic()
+        tmp = graph_utils.find_best_settlement(
+            graph,
+            deadline=time.monotonic() + 0.5,
+            workers=2,
+            strategies=["zero_sum", "largest"],
+        )
+        assert time.monotonic() - start < 5
+        assert not tmp["is_complete"]
+        graph_utils._assert_graph_correctness(tmp)
+
+    @pytest.mark.parametrize("workers", [None, 2])
+    def test_process_batch_CSV(self, tmp_path, workers):
+        paths = {"Trip 1": "./data/Test_Case_1.csv", "Trip 2": "./data/Test_Case_2.csv"}
+        path = tmp_path / "groups.csv"
+        pd.concat(
+            [pd.read_csv(p, dtype=str).assign(Group=g) for g, p in paths.items()]
+        ).to_csv(path, index=False)
+
+        save_path = tmp_path / "settled.csv"
+        graphs = graph_utils.process_batch_CSV(
+            str(path), save_csv_path=str(save_path), workers=workers
+        )
+
+        assert list(graphs) == list(paths)
+        for group, p in paths.items():
+            # Small groups are settled directly, the transactions may come in another order
+            assert sorted(
+                (e["origin"]["name"], e["destination"]["name"], e["weight"])
+                for e in graphs[group]["edges"]
+            ) == sorted(
+                (e["origin"]["name"], e["destination"]["name"], e["weight"])
+                for e in graph_utils.process_CSV(p)["edges"]
+            )
+
+        saved = pd.read_csv(save_path)
+        assert list(saved.columns) == ["Group", "Giver", "Receiver", "Amount"]
+        assert len(saved) == sum(len(g["edges"]) for g in graphs.values())
+
+    @pytest.mark.parametrize("seed", [0, 1])
+    def test_settle_small_group(self, seed):
+        rng = random.Random(seed)
+        for _ in range(20):
+            values = [rng.choice([-1, 1]) * rng.randint(1, 9) * 100 for _ in range(9)]
+            balances = {
+                chr(ord("A") + i): b for i, b in enumerate(values + [-sum(values)])
+            }
+
+            tmp = graph_utils._settle_small_group(balances, name="Trip")
+            graph_utils._assert_graph_correctness(tmp)
+
+            assert tmp["name"] == "Trip"
+            assert tmp["is_complete"]
+            assert len(tmp["edges"]) == len(
+                graph_utils.settle_graph(graph_utils.balances_to_graph(balances))["edges"]
+            )
+
+    def test_settle_groups_small_and_large(self, monkeypatch):
+        monkeypatch.setattr(graph_utils, "_EXACT_LIMIT", 3)
+        balances = {
+            "Small": {"A": 300, "B": -100, "C": -200},
+            "Large": {"A": 300, "B": -100, "C": -200, "D": 500, "E": -500},
+        }
+
+        for strategies in [None, ["largest"]]:
+            graphs = graph_utils.settle_groups(balances, strategies=strategies)
+
+            assert list(graphs) == ["Small", "Large"]
+            assert [len(g["edges"]) for g in graphs.values()] == [2, 3]
+            for g in graphs.values():
+                graph_utils._assert_graph_correctness(g)
+
+    def test_settlement_key(self):
+        balances = {"A": 300, "B": -100, "C": -200}
+
+        assert graph_utils.settlement_key(balances) == graph_utils.settlement_key(
+            {"C": -200, "A": 300, "B": -100}
+        )
+        assert graph_utils.settlement_key(balances) != graph_utils.settlement_key(
+            {**balances, "D": 0}
+        )
+        assert graph_utils.settlement_key(balances) != graph_utils.settlement_key(
+            balances, ["largest"]
+        )
+
+    @pytest.mark.parametrize("on_disk", [False, True])
+    def test_settlement_cache(self, tmp_path, monkeypatch, on_disk):
+        cache = graph_utils.SettlementCache(
+            max_entries=1, directory=str(tmp_path) if on_disk else None
+        )
+        first = graph_utils.process_CSV("./data/Test_Case_2.csv", cache=cache)
+
+        calls = []
+        settle_graph = graph_utils.settle_graph
+        monkeypatch.setattr(
+            graph_utils,
+            "settle_graph",
+            lambda *args, **kwargs: calls.append(args) or settle_graph(*args, **kwargs),
+        )
+
+        # A fresh cache on the same directory only finds the graph on disk
+        if on_disk:
+            cache = graph_utils.SettlementCache(directory=str(tmp_path))
+        second = graph_utils.process_CSV("./data/Test_Case_2.csv", cache=cache)
+
+        assert calls == []
+        assert [
+            (e["origin"]["name"], e["destination"]["name"], e["weight"])
+            for e in second["edges"]
+        ] == [
+            (e["origin"]["name"], e["destination"]["name"], e["weight"])
+            for e in first["edges"]
+        ]
+
+        # Test_Case_1 pushes Test_Case_2 out of the memory
+        graph_utils.process_CSV("./data/Test_Case_1.csv", cache=cache)
+        graph_utils.process_CSV("./data/Test_Case_2.csv", cache=cache)
+        assert len(calls) == (1 if on_disk else 2)
+
+    def test_settlement_cache_evicted_meanwhile(self, tmp_path, monkeypatch):
+        graph_utils.process_CSV(
+            "./data/Test_Case_2.csv",
+            cache=graph_utils.SettlementCache(directory=str(tmp_path)),
+        )
+
+        # Another process removes the file between reading and touching it
+        def evicted(path, *args):
+            os.remove(path)
+            raise FileNotFoundError(path)
+
+        monkeypatch.setattr(graph_utils.os, "utime", evicted)
+        tmp = graph_utils.process_CSV(
+            "./data/Test_Case_2.csv",
+            cache=graph_utils.SettlementCache(directory=str(tmp_path)),
+        )
+
+        assert len(tmp["edges"]) == 7
+
+    @pytest.mark.parametrize("seed", [0, 1, 2])
+    def test_ledger(self, seed):
+        rng = random.Random(seed)
+        names = [chr(ord("A") + i) for i in range(12)]
+        ledger = graph_utils.Ledger()
+        expenses = []
+
+        for _ in range(300):
+            if expenses and rng.random() < 0.3:
+                ledger.remove_expense(*expenses.pop(rng.randrange(len(expenses))))
+            else:
+                giver, receiver = rng.sample(names, 2)
+                expenses.append((giver, receiver, rng.randint(1, 50) * 100))
+                ledger.add_expense(*expenses[-1])
+
+            if rng.random() < 0.2:
+                graph_utils._assert_graph_correctness(ledger.settlement())
+
+        df = pd.DataFrame(expenses, columns=["Giver", "Receiver", "Amount"])
+        expected = graph_utils.net_balance_from_df(df)
+        assert {k: v for k, v in ledger.balances.items() if v} == {
+            k: v for k, v in expected.items() if v
+        }
+
+        tmp = ledger.settlement()
+        graph_utils._assert_graph_correctness(tmp)
+        assert len(tmp["edges"]) < len(names)
+
+        ledger.recompute()
+        assert len(ledger.settlement()["edges"]) == len(
+            graph_utils.settle_graph(graph_utils.balances_to_graph(ledger.balances))[
+                "edges"
+            ]
+        )
+
+    def test_ledger_repair(self, monkeypatch):
+        ledger = graph_utils.Ledger()
+        for i, giver in enumerate("ACEGI"):
+            ledger.add_expense(giver, chr(ord(giver) + 1), 300 + 200 * i)
+        ledger.settlement()
+
+        calls = []
+        settle_graph = graph_utils.settle_graph
+        monkeypatch.setattr(
+            graph_utils,
+            "settle_graph",
+            lambda g, **kwargs: calls.append(list(g["nodes"])) or settle_graph(g, **kwargs),
+        )
+
+        # Both already pay each other, so only that transaction changes
+        ledger.add_expense("A", "B", 200)
+        assert [
+            (e["origin"]["name"], e["destination"]["name"], e["weight"])
+            for e in ledger.settlement()["edges"]
+        ][:3] == [("B", "A", 500), ("D", "C", 500), ("F", "E", 700)]
+        assert calls == []
+
+        # Only A, B, C and D are settled again, the others are not touched
+        ledger.add_expense("C", "B", 100)
+        graph_utils._assert_graph_correctness(ledger.settlement())
+        assert calls == [["A", "B", "C", "D"]]
+
+        with pytest.raises(KeyError):
+            ledger.remove_expense("A", "B", 1)
+        with pytest.raises(ValueError):
+            ledger.add_expense("A", "B", 0)
+
+    @pytest.mark.parametrize("trace_memory", [False, True])
+    def test_settlement_stats(self, tmp_path, trace_memory):
+        calls = []
+        stats = graph_utils.SettlementStats(
+            trace_memory=trace_memory,
+            hooks=[lambda stage, seconds, peak: calls.append(stage)],
+        )
+
+        tmp = graph_utils.process_CSV(
+            "./data/Test_Case_2.csv", str(tmp_path / "out.csv"), stats=stats
+        )
+        graph_utils._assert_graph_correctness(tmp)
+
+        for stage in [
+            "parse",
+            "netting",
+            "exact_matches",
+            "split_components",
+            "verify",
+            "save",
+        ]:
+            assert stats.stages[stage]["calls"] >= 1
+        assert "strategy:largest" in stats.stages
+        assert sorted(set(calls)) == sorted(stats.stages)
+        assert stats.counters["copies"] > 0
+        assert stats.counters["subset_searches"] > 0
+        assert (stats.stages["parse"]["peak_memory"] > 0) == trace_memory
+
+        # Nothing is collected outside of process_CSV
+        assert graph_utils._stats is None
+        before = stats.as_dict()
+        graph_utils.process_CSV("./data/Test_Case_2.csv")
+        assert stats.as_dict() == before
+
+    def test_profile_balances(self):
+        graph = graph_utils.balances_to_graph(
+            {"A": 300, "B": -300, "C": 600, "D": -900, "E": 0}
+        )
+
+        assert graph_utils.profile_balances(graph) == {
+            "non_zero": 4,
+            "positive": 2,
+            "negative": 2,
+            "exact_pairs": 1,
+            "max_balance": 900,
+            "gcd": 300,
+            "positive_bits": 2 * (3 + 1),
+            "negative_bits": 2 * (4 + 1),
+        }
+
+    @pytest.mark.parametrize(
+        ("count", "max_balance", "expected"),
+        [
+            (10, 10**6, ["largest", "zero_sum"]),
+            (60, 100, ["largest", "closest", "matching", "matching_closest", "zero_sum"]),
+            (600, 10**7, ["largest", "closest"]),
+        ],
+        ids=["AUTO - Exact", "AUTO - Small Amounts", "AUTO - Hopeless"],
+    )
+    def test_choose_strategies(self, count, max_balance, expected):
+        rng = random.Random(0)
+        values = [rng.randint(1, max_balance) for _ in range(count)]
+        # The last balance makes everything add up to 0
+        balances = {f"P{i}": v * (-1) ** i for i, v in enumerate(values)}
+        balances["Rest"] = -sum(balances.values())
+
+        graph = graph_utils.balances_to_graph(balances)
+        assert graph_utils.choose_strategies(graph) == expected
+
+    def test_choose_strategies_time_limit(self, monkeypatch):
+        graph = graph_utils.balances_to_graph(
+            {f"P{i}": v for i, v in enumerate([5, 7, 11, -4, -9, -10])}
+        )
+        assert graph_utils.choose_strategies(graph) == ["largest", "zero_sum"]
+
+        # Even the exact search of few balances has to finish in time
+        monkeypatch.setattr(graph_utils, "_AUTO_SECONDS_LIMIT", 1e-9)
+        assert graph_utils.choose_strategies(graph) == ["largest"]
+
+    @pytest.mark.parametrize(
+        "path_to_csv",
+        ["./data/Test_Case_1.csv", "./data/Test_Case_2.csv"],
+        ids=["TEST CASE 1", "TEST CASE 2"],
+    )
+    def test_auto_strategy(self, path_to_csv):
+        tmp = graph_utils.process_CSV(path_to_csv, strategies=["auto"])
+
+        graph_utils._assert_graph_correctness(tmp)
+        assert len(tmp["edges"]) == len(graph_utils.process_CSV(path_to_csv)["edges"])
+
+    @pytest.mark.parametrize("with_group", [False, True])
+    def test_settlement_writer(self, with_group):
+        graph = graph_utils.process_CSV("./data/Test_Case_2.csv")
+        group = ("Trip",) if with_group else ()
+        expected = [
+            (*group, e["origin"]["name"], e["destination"]["name"], e["weight"])
+            for e in graph["edges"]
+        ]
+
+        out = io.StringIO()
+        with graph_utils.SettlementWriter(out, "csv", with_group=with_group) as writer:
+            writer.write(graph["edges"], group="Trip")
+        df = pd.read_csv(io.StringIO(out.getvalue()), dtype={"Amount": str})
+        assert [
+            (*row[:-1], int(row[-1].replace(".", "")))
+            for row in df.itertuples(index=False)
+        ] == expected
+
+        out = io.StringIO()
+        with graph_utils.SettlementWriter(out, "ndjson", with_group=with_group) as writer:
+            writer.write(graph["edges"], group="Trip")
+        assert [
+            tuple(json.loads(line).values()) for line in out.getvalue().splitlines()
+        ] == expected
+
+        out = io.BytesIO()
+        with graph_utils.SettlementWriter(out, "binary", with_group=with_group) as writer:
+            writer.write(graph["edges"], group="Trip")
+        out.seek(0)
+        assert list(graph_utils.read_binary_settlement(out)) == expected
+
+    def test_settlement_writer_without_group(self):
+        graph = graph_utils.process_CSV("./data/Test_Case_1.csv")
+
+        out = io.StringIO()
+        with graph_utils.SettlementWriter(out, "csv", with_group=True) as writer:
+            writer.write(graph["edges"])
+        assert all(line.startswith(",") for line in out.getvalue().splitlines()[1:])
+
+        binary = io.BytesIO()
+        with graph_utils.SettlementWriter(binary, "binary", with_group=True) as writer:
+            writer.write(graph["edges"])
+        binary.seek(0)
+        assert {r[0] for r in graph_utils.read_binary_settlement(binary)} == {""}
+
+    def test_settlement_writer_stdout(self, capsys):
+        graph_utils.process_CSV("./data/Test_Case_1.csv", "-", output_format="ndjson")
+
+        lines = capsys.readouterr().out.splitlines()
+        assert len(lines) == 5
+        assert set(json.loads(lines[0])) == {"Giver", "Receiver", "Cents"}
+
+    def test_shared_matching_phase(self, monkeypatch):
+        calls = []
+        match_differences = graph_utils._match_differences
+
+        def counting_match_differences(graph, deadline=None):
+            calls.append(graph)
+            return match_differences(graph, deadline=deadline)
+
+        monkeypatch.setattr(
+            graph_utils, "_match_differences", counting_match_differences
+        )
+
+        tmp = graph_utils.find_best_settlement(
+            graph_utils.reduce_net_balance(TEST_GRAPHS["counter_example_opposite"])
+        )
+
+        graph_utils._assert_graph_correctness(tmp)
+        assert len(calls) == 1
+
+    @pytest.mark.parametrize("workers", [None, 2])
+    def test_settle_components(self, workers):
+        rng = random.Random(0)
+        values = [rng.randint(-5000, 5000) for _ in range(60)]
+        values.append(-sum(values))
+        graph = graph_utils.balances_to_graph(
+            {f"P{i}": v for i, v in enumerate(values)}
+        )
+
+        components = graph_utils.split_zero_sum_components(graph)
+
+        assert len(components) > 1
+        assert sorted(n for c in components for n in c["nodes"]) == sorted(
+            n for n, v in zip(graph["nodes"], values) if v != 0
+        )
+        for c in components:
+            assert sum(n["current_net_balance"] for n in c["nodes"].values()) == 0
+
+        tmp = graph_utils.settle_components(graph, workers=workers)
+
+        graph_utils._assert_graph_correctness(tmp)
+        assert len(tmp["edges"]) <= len(graph_utils.find_best_settlement(graph)["edges"])
+
+    @pytest.mark.parametrize(
+        ("time_budget", "is_complete"),
+        [
+            (None, True),
+            (0, False),
+        ],
+        ids=[
+            "NO TIME BUDGET",
+            "TIME BUDGET USED UP",
+        ],
+    )
+    def test_time_budget(self, time_budget, is_complete):
+        tmp = graph_utils.process_CSV("./data/Test_Case_2.csv", time_budget=time_budget)
+
+        graph_utils._assert_graph_correctness(tmp)
+        assert tmp["is_complete"] == is_complete
+
+    @pytest.mark.parametrize(
+        "algorithm",
+        [
+            graph_utils.pair_matching_differences_first,
+            graph_utils.pair_zero_sum_groups_first,
+        ],
+    )
+    def test_expired_deadline(self, algorithm):
+        tmp = algorithm(
+            graph_utils.reduce_net_balance(TEST_GRAPHS["problematic_matching"]),
+            deadline=0,
+        )
+
+        graph_utils._assert_graph_correctness(tmp)
+        assert not tmp["is_complete"]
+
+    @pytest.mark.parametrize(
+        "algorithm",
+        [
+            graph_utils.pair_matching_differences_first,
+            graph_utils.pair_zero_sum_groups_first,
+        ],
+    )
+    def test_index_not_ready_before_deadline(self, monkeypatch, algorithm):
+        # Every index is expected to take far longer than the time that is left
+        monkeypatch.setattr(graph_utils, "_BITSET_BITS_PER_SECOND", 1.0)
+
+        rng = random.Random(0)
+        values = [rng.choice([-1, 1]) * rng.randint(1, 500) for _ in range(39)]
+        graph = graph_utils.balances_to_graph(
+            {f"P{i}": v for i, v in enumerate(values + [-sum(values)])}
+        )
+
+        stats = graph_utils.SettlementStats()
+        with graph_utils.collect_stats(stats):
+            tmp = algorithm(graph, deadline=time.monotonic() + 60)
+
+        graph_utils._assert_graph_correctness(tmp)
+        assert not tmp["is_complete"]
+        assert "subset_indices" not in stats.counters
+        assert stats.counters["subset_indices_skipped"] > 0
+
+    @pytest.mark.parametrize("python_size", [0, 64], ids=["arrays", "python"])
+    @pytest.mark.parametrize("copied_nodes", [False, True])
+    @pytest.mark.parametrize("level", ["sampled", "full"])
+    def test_assertion_levels(self, monkeypatch, level, copied_nodes, python_size):
+        monkeypatch.setattr(graph_utils, "_VERIFY_SAMPLE_SIZE", 3)
+        monkeypatch.setattr(graph_utils, "_VERIFY_PYTHON_SIZE", python_size)
+        graph = graph_utils.pair_largest_difference_first(
+            graph_utils.balances_to_graph({"A": 300, "B": 500, "C": -300, "D": -500})
+        )
+        if copied_nodes:
+            # The edges can not be matched to the nodes by identity, only by name
+            for e in graph["edges"]:
+                e["origin"] = e["origin"].copy()
+                e["destination"] = e["destination"].copy()
+        graph_utils._assert_graph_correctness(graph, level=level)
+
+        # The totals still add up, but A and B pay the wrong amount
+        edges = sorted(graph["edges"], key=lambda e: e["weight"])
+        edges[0]["weight"], edges[1]["weight"] = edges[1]["weight"], edges[0]["weight"]
+        with pytest.raises(AssertionError):
+            graph_utils._assert_graph_correctness(graph, level=level)
+
+        graph_utils._assert_graph_correctness(graph, level="off")
+        with pytest.raises(ValueError):
+            graph_utils._assert_graph_correctness(graph, level="some")
+
+    def test_assertion_large_sums(self, monkeypatch):
+        monkeypatch.setattr(graph_utils, "_VERIFY_PYTHON_SIZE", 0)
+
+        # C gets more than 2^54 cents, which a float sum can not hold exactly
+        graph = graph_utils.pair_largest_difference_first(
+            graph_utils.balances_to_graph(
+                {"A": 2**53 + 1, "B": 2**53 + 2, "C": -(2**54 + 3)}
+            )
+        )
+        graph_utils._assert_graph_correctness(graph)
+
     @pytest.mark.parametrize(
         ("graph", "is_expected_to_fail"),
         [
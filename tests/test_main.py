@@ -0,0 +1,45 @@
+"""
+Test Cases for the command line interface.
+"""
+
+import pandas as pd
+import pytest
+
+from src import main
+
+
+class TestMain:
+    @pytest.mark.parametrize("workers", [None, 2])
+    def test_main(self, tmp_path, capsys, workers):
+        argv = ["./data/Test_Case_*.csv", "--output-dir", str(tmp_path)]
+        if workers is not None:
+            argv += ["--workers", str(workers)]
+
+        assert main.main(argv) == 0
+
+        out = capsys.readouterr().out
+        assert "Test_Case_1.csv: 5 transactions" in out
+        assert "Test_Case_2.csv: 7 transactions" in out
+        assert len(pd.read_csv(tmp_path / "Test_Case_2_settled.csv")) == 7
+
+    def test_main_stats(self, capsys):
+        assert main.main(["./data/Test_Case_2.csv", "--stats"]) == 0
+
+        out = capsys.readouterr().out
+        assert "parse" in out
+        assert "strategy:largest" in out
+
+    def test_main_missing_file(self, capsys):
+        assert main.main(["./data/Test_Case_1.csv", "./data/missing.csv"]) == 1
+        assert "missing.csv: failed" in capsys.readouterr().err
+
+    def test_main_unknown_strategy(self):
+        with pytest.raises(SystemExit):
+            main.main(["./data/Test_Case_1.csv", "--strategy", "fastest"])
+
+    def test_main_auto_strategy(self, capsys):
+        with pytest.raises(SystemExit):
+            main.main(["./data/Test_Case_1.csv", "-s", "auto", "-s", "largest"])
+        assert "can not be combined" in capsys.readouterr().err
+
+        assert main.main(["./data/Test_Case_1.csv", "-s", "auto", "-s", "auto"]) == 0